@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Offline batch question answering for the RAG AI Agent.
+Streams questions from a JSONL or CSV file, retrieves context in batches,
+generates answers with bounded concurrency while the next batch is being
+retrieved, and appends results to a JSONL file as they finish. The output
+file doubles as the checkpoint: rerunning the same command skips every
+question already answered.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Set
+
+# Add src directories to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/rag'))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/utils'))
+
+def read_questions(path: str) -> Iterator[Dict[str, str]]:
+    """Stream ``{"id", "question"}`` items from a JSONL or CSV file.
+
+    Each record needs a ``question`` (or ``query``) field; ``id`` defaults to
+    ``row-<position>`` so it cannot collide with an explicit numeric id.
+    Duplicate ids raise ``ValueError``, since resuming would skip all but one.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        seen = set()
+        for position, record in enumerate(records, start=1):
+            question = (record.get("question") or record.get("query") or "").strip()
+            if question:
+                record_id = record.get("id")
+                record_id = f"row-{position}" if record_id in (None, "") else str(record_id)
+                if record_id in seen:
+                    raise ValueError(f"Duplicate question id {record_id!r} at record {position} of {path}")
+                seen.add(record_id)
+                yield {"id": record_id, "question": question}
+
+def load_completed(output_path: str) -> Set[str]:
+    """Return ids already answered in ``output_path`` and tidy the file for appending.
+
+    Failed answers and a partially written last line (from a crash) are
+    dropped so those questions are retried.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    completed = set()
+    kept = []
+    dirty = False
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                dirty = True
+                continue
+            if result.get("error"):
+                dirty = True
+                continue
+            completed.add(result["id"])
+            if not line.endswith("\n"):
+                dirty = True
+                line += "\n"
+            kept.append(line)
+
+    if dirty:
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp_path, output_path)
+    return completed
+
+def answer(agent, item: Dict[str, str], docs: List, retrieval_seconds: float) -> Dict[str, Any]:
+    """Generate one answer and package it with its sources and timings."""
+    from agent import ERROR_RESPONSE_PREFIX
+    from helpers import format_response
+    from retriever import chunk_checksum
+
+    start = time.perf_counter()
+    response = agent.generate_response(item["question"], docs)
+    generation_seconds = time.perf_counter() - start
+
+    result = {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": format_response(response),
+        "sources": [
+            {"filename": filename, "chunk_id": metadata["chunk_id"],
+             "checksum": chunk_checksum(text), "score": round(metadata["score"], 4)}
+            for filename, text, metadata in docs
+        ],
+        "timings": {
+            "retrieval_seconds": round(retrieval_seconds, 4),
+            "generation_seconds": round(generation_seconds, 4)
+        }
+    }
+    if response.startswith(ERROR_RESPONSE_PREFIX):
+        result["error"] = response
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the RAG agent.")
+    parser.add_argument("input", help="JSONL or CSV file with a 'question' column/field")
+    parser.add_argument("output", help="JSONL file for answers; also the resume checkpoint")
+    parser.add_argument("--batch-size", type=int, default=32, help="Questions retrieved per batch")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM calls")
+    parser.add_argument("--top-k", type=int, default=3, help="Chunks retrieved per question")
+    parser.add_argument("--collection", help="Knowledge base under knowledge_bases/ (default: documents/)")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint for the agent")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main batch function."""
+    args = parse_args(argv)
+
+    from retriever import DocumentRetriever
+    from agent import RAGAgent
+
+    print("🚀 Starting batch question answering")
+    print("=" * 50)
+
+    completed = load_completed(args.output)
+    if completed:
+        print(f"♻️  Resuming: {len(completed)} questions already answered")
+
+    if args.collection:
+        from collection_manager import CollectionManager
+        retriever = CollectionManager().get(args.collection)
+    else:
+        retriever = DocumentRetriever()
+    agent = RAGAgent(base_url=args.base_url)
+
+    pending = (item for item in read_questions(args.input) if item["id"] not in completed)
+    counts = {"answered": 0, "errors": 0}
+    write_lock = threading.Lock()
+    # Allow one extra round of queued questions so workers stay busy while
+    # the next batch is being retrieved
+    slots = threading.BoundedSemaphore(args.concurrency * 2)
+    start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+
+        def on_done(future, item):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": item["id"], "question": item["question"], "error": f"{type(e).__name__}: {e}"}
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["errors" if result.get("error") else "answered"] += 1
+            slots.release()
+
+        while True:
+            batch = list(islice(pending, args.batch_size))
+            if not batch:
+                break
+
+            retrieval_start = time.perf_counter()
+            batch_docs = retriever.retrieve_batch([item["question"] for item in batch], top_k=args.top_k)
+            # Retrieval cost is shared by the batch, so attribute an even share to each question
+            retrieval_seconds = (time.perf_counter() - retrieval_start) / len(batch)
+
+            for item, docs in zip(batch, batch_docs):
+                slots.acquire()
+                future = pool.submit(answer, agent, item, docs, retrieval_seconds)
+                future.add_done_callback(lambda f, item=item: on_done(f, item))
+
+            # Make finished answers durable once per batch
+            with write_lock:
+                os.fsync(out.fileno())
+                elapsed = time.perf_counter() - start
+                print(f"✅ {counts['answered']} answered, {counts['errors']} failed "
+                      f"({counts['answered'] / elapsed:.2f} questions/s)")
+
+        pool.shutdown(wait=True)
+        os.fsync(out.fileno())
+
+    answered, errors = counts["answered"], counts["errors"]
+    print("=" * 50)
+    print(f"🎉 Done: {answered} answered, {errors} failed, {len(completed)} skipped")
+    if errors:
+        print("⚠️  Rerun the same command to retry failed questions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for the RAG AI Agent.
+Replays a query log or a synthetic query mix through retrieval and response
+generation at increasing concurrency, against a local OpenAI-compatible
+stand-in so results reflect this instance rather than the LLM provider.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+# Add src directories to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/rag'))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/utils'))
+
+SYNTHETIC_QUERIES = [
+    # (query, weight)
+    ("What are the key principles of AI ethics?", 3),
+    ("Explain the different types of machine learning", 3),
+    ("How does bias affect AI systems?", 2),
+    ("What are the best practices for ML development?", 2),
+    ("What is overfitting and how can it be prevented?", 2),
+    ("Who is responsible when an AI system makes a mistake?", 1),
+    ("What is the capital of France?", 1),
+    ("Hello, how are you?", 1),
+    ("Thanks, bye!", 1),
+]
+
+class FakeLLMServer:
+    """Local stand-in for the OpenAI chat completions API.
+
+    Each request sleeps for ``latency`` seconds plus the time needed to
+    "generate" ``completion_tokens`` at ``tokens_per_second``, then returns a
+    canned answer. ``error_rate`` makes that fraction of requests fail with
+    HTTP 500.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3,
+                 tokens_per_second: float = 50.0, completion_tokens: int = 150,
+                 jitter: float = 0.1, error_rate: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                delay = fake.latency + fake.completion_tokens / fake.tokens_per_second
+                delay *= 1 + random.uniform(-fake.jitter, fake.jitter)
+                time.sleep(max(delay, 0))
+
+                if random.random() < fake.error_rate:
+                    self._reply(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+                    return
+
+                # Roughly four characters per token is close enough for load testing
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+                content = " ".join(["token"] * fake.completion_tokens)
+                self._reply(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_chars // 4,
+                        "completion_tokens": fake.completion_tokens,
+                        "total_tokens": prompt_chars // 4 + fake.completion_tokens
+                    }
+                })
+
+            def _reply(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def load_queries(path: Optional[str], count: int, seed: int = 0) -> List[str]:
+    """Load queries from a log file, or sample ``count`` from the synthetic mix.
+
+    A log is either plain text with one query per line or JSONL with a
+    ``question`` (or ``query``) field per line.
+    """
+    if path:
+        queries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    line = record.get("question") or record.get("query") or ""
+                if line:
+                    queries.append(line)
+        if not queries:
+            raise ValueError(f"No queries found in {path}")
+        return queries
+
+    rng = random.Random(seed)
+    texts = [q for q, _ in SYNTHETIC_QUERIES]
+    weights = [w for _, w in SYNTHETIC_QUERIES]
+    return rng.choices(texts, weights=weights, k=count)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[rank]
+
+def run_level(retriever, agent, queries: List[str], concurrency: int, requests: int,
+              top_k: int) -> Dict[str, Any]:
+    """Run ``requests`` queries through the pipeline from ``concurrency`` clients."""
+    from agent import ERROR_RESPONSE_PREFIX
+
+    def one(i: int) -> Dict[str, Any]:
+        query = queries[i % len(queries)]
+        start = time.perf_counter()
+        try:
+            docs = retriever.retrieve(query, top_k=top_k)
+            retrieved = time.perf_counter()
+            response = agent.generate_response(query, docs)
+            ok = not response.startswith(ERROR_RESPONSE_PREFIX)
+        except Exception:
+            retrieved = time.perf_counter()
+            ok = False
+        end = time.perf_counter()
+        return {"ok": ok, "latency": end - start, "retrieval": retrieved - start}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = [s["latency"] for s in samples if s["ok"]]
+    errors = sum(1 for s in samples if not s["ok"])
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": wall,
+        "throughput_rps": (requests - errors) / wall if wall else 0.0,
+        "error_rate": errors / requests if requests else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p90": percentile(latencies, 90),
+        "latency_p99": percentile(latencies, 99),
+        "latency_mean": statistics.mean(latencies) if latencies else 0.0,
+        "retrieval_p50": percentile([s["retrieval"] for s in samples], 50),
+    }
+
+def find_saturation(levels: List[Dict[str, Any]], min_gain: float = 0.1,
+                    max_error_rate: float = 0.05) -> Optional[int]:
+    """Return the first concurrency level past which throughput stops scaling.
+
+    Saturation is reached when a step to the next tested level improves
+    throughput by less than ``min_gain`` or the error rate exceeds
+    ``max_error_rate``.
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if current["error_rate"] > max_error_rate:
+            return previous["concurrency"]
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 + min_gain):
+            return previous["concurrency"]
+    return None
+
+def print_report(levels: List[Dict[str, Any]], saturation: Optional[int]):
+    """Print a table of results per concurrency level."""
+    print("\n📊 Load Test Report")
+    print("=" * 78)
+    print(f"{'clients':>8} {'req/s':>8} {'errors':>8} {'p50 (s)':>9} {'p90 (s)':>9} {'p99 (s)':>9} {'retrieval p50':>14}")
+    print("-" * 78)
+    for level in levels:
+        print(f"{level['concurrency']:>8} {level['throughput_rps']:>8.2f} {level['error_rate']:>7.1%} "
+              f"{level['latency_p50']:>9.3f} {level['latency_p90']:>9.3f} {level['latency_p99']:>9.3f} "
+              f"{level['retrieval_p50']:>14.4f}")
+    print("=" * 78)
+    if saturation is None:
+        print("✅ Throughput kept scaling at every tested concurrency level")
+    else:
+        print(f"⚠️  Saturation reached at {saturation} concurrent clients")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the RAG retrieval and agent pipeline.")
+    parser.add_argument("--query-log", help="Text or JSONL file of queries to replay (default: synthetic mix)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32",
+                        help="Comma-separated concurrency levels (default: 1,2,4,8,16,32)")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--top-k", type=int, default=3, help="Chunks retrieved per query")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0, help="Fake LLM generation rate")
+    parser.add_argument("--llm-completion-tokens", type=int, default=150, help="Tokens per fake completion")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail")
+    parser.add_argument("--base-url", help="Use this OpenAI-compatible endpoint instead of the fake server")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic query mix")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main load test function."""
+    args = parse_args(argv)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    from retriever import DocumentRetriever
+    from agent import RAGAgent
+
+    print("🚀 Starting RAG AI Agent Load Test")
+    print("=" * 50)
+
+    queries = load_queries(args.query_log, args.requests, args.seed)
+    print(f"✅ Loaded {len(queries)} queries")
+
+    retriever = DocumentRetriever()
+    print(f"✅ Retriever ready ({len(retriever.chunk_texts)} chunks)")
+
+    fake = None
+    base_url = args.base_url
+    if not base_url:
+        fake = FakeLLMServer(
+            latency=args.llm_latency,
+            tokens_per_second=args.llm_tokens_per_second,
+            completion_tokens=args.llm_completion_tokens,
+            error_rate=args.llm_error_rate
+        ).start()
+        base_url = fake.base_url
+        os.environ["OPENAI_API_KEY"] = "sk-local-load-test"
+        print(f"✅ Fake LLM server listening at {base_url}")
+
+    try:
+        # Without retries every failed LLM call counts as an error, and backoff
+        # waits do not leak into the latency percentiles
+        agent = RAGAgent(base_url=base_url, max_retries=0)
+        results = []
+        for concurrency in levels:
+            print(f"⏱️  Running {args.requests} requests with {concurrency} concurrent clients...")
+            results.append(run_level(retriever, agent, queries, concurrency, args.requests, args.top_k))
+    finally:
+        if fake:
+            fake.stop()
+
+    saturation = find_saturation(results)
+    print_report(results, saturation)
+    prompt_totals = agent.get_prompt_report()["totals"]
+    print(f"📝 Prompt tokens: {prompt_totals['prompt_tokens']} sent, "
+          f"{prompt_totals['saved_tokens']} saved versus the legacy template")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"levels": results, "saturation_concurrency": saturation,
+                       "prompt_tokens": prompt_totals}, f, indent=2)
+        print(f"📝 Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Profiling workload for the RAG AI Agent.
+Builds the index and answers a batch of queries twice: once under cProfile
+and a stack sampler, and once under tracemalloc so allocation tracking does
+not skew the CPU ranking. Writes flame-graph-compatible output and a ranked
+report of CPU and allocation hot spots in the project's own modules.
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+# Add src directories to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/rag'))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src/utils'))
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+PROFILES_PATH = os.path.join(ROOT_PATH, 'profiles')
+# Source directories whose hot spots are reported; third-party modules with
+# the same file names (e.g. langchain's agent.py) are excluded
+TARGET_DIRS = (os.path.join(ROOT_PATH, 'src', 'rag'), os.path.join(ROOT_PATH, 'src', 'utils'))
+
+def is_target(filename: str) -> bool:
+    """Whether ``filename`` is a module of this project."""
+    return os.path.dirname(os.path.abspath(filename)) in TARGET_DIRS
+
+class StackSampler:
+    """Periodically sample the call stack of one thread, pyinstrument-style.
+
+    Samples are aggregated as folded stacks (``outer;inner count`` lines),
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def run_workload(queries: List[str], base_url: str):
+    """Build the index and answer ``queries`` end to end."""
+    from retriever import DocumentRetriever
+    from agent import RAGAgent
+    from helpers import validate_question, format_response
+
+    retriever = DocumentRetriever()
+    agent = RAGAgent(base_url=base_url)
+    for query in queries:
+        if not validate_question(query):
+            continue
+        docs = retriever.retrieve(query, top_k=3)
+        format_response(agent.generate_response(query, docs))
+
+def cpu_hot_spots(stats: pstats.Stats, limit: int) -> List[str]:
+    """Rank functions in the target directories by their own CPU time."""
+    rows = []
+    for (filename, line, func), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+        if is_target(filename):
+            rows.append((tottime, cumtime, nc, f"{os.path.relpath(filename, ROOT_PATH)}:{line}({func})"))
+    rows.sort(reverse=True)
+    return [
+        f"{tottime:>10.4f} {cumtime:>10.4f} {calls:>8}  {name}"
+        for tottime, cumtime, calls, name in rows[:limit]
+    ]
+
+def allocation_hot_spots(snapshot: tracemalloc.Snapshot, limit: int) -> List[str]:
+    """Rank source lines in the target directories by memory they allocated."""
+    filters = [tracemalloc.Filter(True, os.path.join(path, "*")) for path in TARGET_DIRS]
+    top = [stat for stat in snapshot.filter_traces(filters).statistics("lineno")
+           if is_target(stat.traceback[0].filename)]
+    return [
+        f"{stat.size / 1024:>10.1f} {stat.count:>8}  "
+        f"{os.path.relpath(stat.traceback[0].filename, ROOT_PATH)}:{stat.traceback[0].lineno}"
+        for stat in top[:limit]
+    ]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Profile index build and query handling.")
+    parser.add_argument("--queries", type=int, default=50, help="Number of queries to answer")
+    parser.add_argument("--top", type=int, default=15, help="Hot spots listed per section")
+    parser.add_argument("--interval", type=float, default=0.005, help="Stack sampling interval (s)")
+    parser.add_argument("--output-dir", help="Where to write profiles (default: profiles/<timestamp>)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main profiling function."""
+    from load_test import FakeLLMServer, load_queries
+
+    args = parse_args(argv)
+    output_dir = args.output_dir or os.path.join(PROFILES_PATH, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    print("📈 Profiling RAG AI Agent workload")
+    print("=" * 50)
+
+    queries = load_queries(None, args.queries)
+    # A zero-latency stand-in keeps the profile focused on local work
+    os.environ["OPENAI_API_KEY"] = "sk-local-profile"
+    with FakeLLMServer(latency=0.0, tokens_per_second=1e9, jitter=0.0) as fake:
+        print("⏱️  CPU pass (cProfile + stack sampler)...")
+        sampler = StackSampler(interval=args.interval)
+        profiler = cProfile.Profile()
+        sampler.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            run_workload(queries, fake.base_url)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+
+        print("🧠 Allocation pass (tracemalloc)...")
+        tracemalloc.start(10)
+        try:
+            run_workload(queries, fake.base_url)
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    prof_path = os.path.join(output_dir, "cpu.prof")
+    folded_path = os.path.join(output_dir, "stacks.folded")
+    report_path = os.path.join(output_dir, "report.txt")
+    profiler.dump_stats(prof_path)
+    sampler.write_folded(folded_path)
+
+    stats = pstats.Stats(profiler)
+    targets = ", ".join(os.path.relpath(path, ROOT_PATH) for path in TARGET_DIRS)
+    lines = [
+        f"Workload: index build + {len(queries)} queries in {elapsed:.2f}s "
+        f"(peak traced memory {peak / 1024 / 1024:.1f} MB)",
+        "",
+        f"Top CPU hot spots in {targets}",
+        f"{'own (s)':>10} {'cum (s)':>10} {'calls':>8}  function",
+        *cpu_hot_spots(stats, args.top),
+        "",
+        f"Top allocation hot spots in {targets}",
+        f"{'KiB':>10} {'blocks':>8}  line",
+        *allocation_hot_spots(snapshot, args.top),
+    ]
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    print("\n".join(lines))
+    print("=" * 50)
+    print(f"📝 Report:        {report_path}")
+    print(f"🔥 Folded stacks: {folded_path} (flamegraph.pl, speedscope)")
+    print(f"📊 cProfile data: {prof_path} (snakeviz, flameprof)")
+
+if __name__ == "__main__":
+    main()
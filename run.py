@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 RAG AI Agent Launcher
-Provides options to run the application or test the system.
+Provides options to run the application, test or profile the system.
 """
 
 import os
@@ -80,6 +80,20 @@ def run_tests():
     except Exception as e:
         print(f"❌ Error running tests: {e}")
 
+def run_profiler():
+    """Run the profiling workload."""
+    print("📈 Profiling index build and queries...")
+    profile_path = Path("profile_rag.py")
+    
+    if not profile_path.exists():
+        print(f"❌ Profiling script not found: {profile_path}")
+        return
+    
+    try:
+        subprocess.run([sys.executable, str(profile_path)])
+    except Exception as e:
+        print(f"❌ Error running profiler: {e}")
+
 def show_menu():
     """Show the main menu."""
     print("\n" + "=" * 50)
@@ -90,6 +104,7 @@ def show_menu():
     print("3. 🔍 Check Environment")
     print("4. 📚 Show Help")
     print("5. 🚪 Exit")
+    print("6. 📈 Profile Workload")
     print("=" * 50)
 
 def show_help():
@@ -107,6 +122,7 @@ def show_help():
     print("- Run the app and ask questions in the chat interface")
     print("- View source documents used for each response")
     print("- Monitor system statistics in the sidebar")
+    print("- Profile the workload to find CPU and memory hot spots (see profiles/)")
     print("\nFor more information, see README.md")
 
 def main():
@@ -115,7 +131,7 @@ def main():
         show_menu()
         
         try:
-            choice = input("\nSelect an option (1-5): ").strip()
+            choice = input("\nSelect an option (1-6): ").strip()
             
             if choice == "1":
                 if check_environment():
@@ -136,8 +152,11 @@ def main():
                 print("👋 Goodbye!")
                 break
             
+            elif choice == "6":
+                run_profiler()
+            
             else:
-                print("❌ Invalid option. Please select 1-5.")
+                print("❌ Invalid option. Please select 1-6.")
         
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
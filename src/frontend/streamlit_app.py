@@ -8,10 +8,18 @@ from datetime import datetime
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../rag')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../utils')))
 
-from retriever import DocumentRetriever
-from agent import RAGAgent
+from retriever import DocumentRetriever, chunk_checksum
+from agent import RAGAgent, ERROR_RESPONSE_PREFIX
+from collection_manager import CollectionManager
+from memory import ConversationMemory
+from stats_server import StatsServer, STATS_PORT_ENV_VAR
 from helpers import validate_question, format_response, truncate_text, extract_keywords
 
+# Messages kept per session; older ones survive only in the conversation summary
+MAX_STORED_MESSAGES = 200
+# Messages rendered per page of chat history
+HISTORY_PAGE_SIZE = 20
+
 # Page configuration
 st.set_page_config(
     page_title="RAG AI Agent",
@@ -59,6 +67,29 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_collection_manager() -> CollectionManager:
+    """Process-wide collection manager shared by all sessions."""
+    return CollectionManager()
+
+@st.cache_resource
+def get_stats_server():
+    """Process-wide statistics endpoint, started when ``RAG_STATS_PORT`` is set."""
+    port = os.getenv(STATS_PORT_ENV_VAR)
+    if not port:
+        return None
+    server = StatsServer(port=int(port)).start()
+    server.register("collections", get_collection_manager().get_stats)
+    return server
+
+def get_retriever():
+    """Return the retriever for the selected knowledge base."""
+    if st.session_state.collection:
+        # Fetch through the manager on every use so evicted collections are
+        # not kept alive by session state
+        return get_collection_manager().get(st.session_state.collection)
+    return st.session_state.retriever
+
 def initialize_session_state():
     """Initialize session state variables."""
     if "messages" not in st.session_state:
@@ -77,12 +108,31 @@ def initialize_session_state():
         st.session_state.agent = None
     if "documents_loaded" not in st.session_state:
         st.session_state.documents_loaded = False
+    if "collection" not in st.session_state:
+        collections = get_collection_manager().list_collections()
+        st.session_state.collection = collections[0] if collections else None
+    if "memory" not in st.session_state:
+        st.session_state.memory = ConversationMemory()
+    if "history_window" not in st.session_state:
+        st.session_state.history_window = HISTORY_PAGE_SIZE
+
+def add_message(message: dict):
+    """Append a chat message, dropping the oldest beyond the session cap."""
+    st.session_state.messages.append(message)
+    if len(st.session_state.messages) > MAX_STORED_MESSAGES:
+        del st.session_state.messages[:-MAX_STORED_MESSAGES]
 
 def load_components():
     """Load RAG components."""
     try:
         with st.spinner("Loading document retriever..."):
-            st.session_state.retriever = DocumentRetriever()
+            if st.session_state.collection:
+                get_collection_manager().get(st.session_state.collection)
+            else:
+                st.session_state.retriever = DocumentRetriever()
+                stats_server = get_stats_server()
+                if stats_server:
+                    stats_server.register("documents", st.session_state.retriever.stats.snapshot)
         
         with st.spinner("Initializing AI agent..."):
             st.session_state.agent = RAGAgent()
@@ -103,6 +153,19 @@ def display_sidebar():
         if st.session_state.documents_loaded:
             st.success("✅ System Ready")
             
+            # Knowledge base selection
+            collections = get_collection_manager().list_collections()
+            if collections:
+                selected = st.selectbox(
+                    "📂 Knowledge Base",
+                    collections,
+                    index=collections.index(st.session_state.collection) if st.session_state.collection in collections else 0
+                )
+                if selected != st.session_state.collection:
+                    st.session_state.collection = selected
+                    with st.spinner(f"Loading {selected}..."):
+                        get_collection_manager().get(selected)
+            
             # Document summary - commented out as requested
             # doc_summary = st.session_state.retriever.get_document_summary()
             # st.markdown("### 📚 Knowledge Base")
@@ -125,6 +188,8 @@ def display_sidebar():
         if st.button("🗑️ Clear Chat"):
             st.session_state.messages = []
             st.session_state.welcome_added = False
+            st.session_state.memory.clear()
+            st.session_state.history_window = HISTORY_PAGE_SIZE
             st.rerun()
         
         if st.button("📊 Show Statistics"):
@@ -138,21 +203,68 @@ def show_statistics():
     
     st.markdown("### 📊 System Statistics")
     
+    corpus_stats = get_retriever().stats
+    corpus = corpus_stats.snapshot()
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        doc_summary = st.session_state.retriever.get_document_summary()
-        total_chunks = sum(doc_summary.values())
-        st.metric("Total Chunks", total_chunks)
+        st.metric("Total Chunks", corpus['total_chunks'])
     
     with col2:
-        st.metric("Documents", len(doc_summary))
+        st.metric("Documents", corpus['documents'])
     
     with col3:
         st.metric("Chat Messages", len(st.session_state.messages))
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Corpus Tokens", corpus['total_tokens'])
+    with col2:
+        st.metric("Index Size (MB)", f"{corpus['index_bytes'] / 1024 / 1024:.2f}")
+    with col3:
+        st.metric("Last Build (s)", f"{corpus['last_build_seconds']:.2f}")
+    
+    age = corpus['snapshot_age_seconds']
+    update_age = corpus['update_age_seconds']
+    st.caption(
+        f"{corpus['index_type'] or 'No index'} · {corpus['embedding_dim']}-dim embeddings · "
+        f"{corpus['total_chars']:,} characters · built {f'{age / 60:.0f} min ago' if age is not None else 'never'}"
+        + (f" · {corpus['updates_since_build']} updates, last {update_age / 60:.0f} min ago "
+           f"({corpus['last_update_seconds']:.2f}s)" if update_age is not None else "")
+    )
+    st.download_button(
+        "⬇️ Export Statistics",
+        corpus_stats.to_json(),
+        file_name="corpus_stats.json",
+        mime="application/json"
+    )
+    
+    prompt_totals = st.session_state.agent.get_prompt_report()["totals"]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Prompt Tokens Sent", prompt_totals["prompt_tokens"])
+    with col2:
+        st.metric("Prompt Tokens Saved", prompt_totals["saved_tokens"])
+    with col3:
+        saved_per_request = prompt_totals["saved_tokens"] / prompt_totals["requests"] if prompt_totals["requests"] else 0
+        st.metric("Saved per Request", f"{saved_per_request:.0f}")
+    
+    if st.session_state.collection:
+        manager_stats = get_collection_manager().get_stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Resident Knowledge Bases", len(manager_stats['resident']))
+        with col2:
+            st.metric("Index Memory (MB)", f"{manager_stats['resident_bytes'] / 1024 / 1024:.1f}")
+        with col3:
+            st.metric("Loads / Evictions", f"{manager_stats['loads']} / {manager_stats['evictions']}")
+
+def display_chat_message(role: str, content: str, sources: list = None, collection: str = None):
+    """Display a chat message with proper styling.
 
-def display_chat_message(role: str, content: str, sources: list = None):
-    """Display a chat message with proper styling."""
+    ``sources`` holds chunk references (filename, chunk id, checksum and
+    score); the chunk text is looked up in the retriever only when rendered.
+    """
     if role == "user":
         st.chat_message("user").write(content)
     else:
@@ -160,9 +272,17 @@ def display_chat_message(role: str, content: str, sources: list = None):
             st.write(content)
             if sources and len(sources) > 0:
                 with st.expander("📚 Sources"):
-                    for i, (filename, text, metadata) in enumerate(sources):
-                        st.markdown(f"**Source {i+1}: {filename}**")
-                        st.text(truncate_text(text, 300))
+                    # Chunks from another knowledge base would need it loaded just to render
+                    retriever = get_retriever() if collection == st.session_state.collection else None
+                    for i, source in enumerate(sources):
+                        st.markdown(f"**Source {i+1}: {source['filename']}** (relevance {source['score']:.2f})")
+                        if retriever is None:
+                            continue
+                        chunk = retriever.find_chunk(source['filename'], source['chunk_id'], source.get('checksum'))
+                        if chunk is None:
+                            st.caption("Source no longer available")
+                        else:
+                            st.text(truncate_text(chunk[1], 300))
 
 def process_user_input(user_input: str):
     """Process user input and generate response."""
@@ -171,15 +291,17 @@ def process_user_input(user_input: str):
         return
     
     # Add user message to chat
-    st.session_state.messages.append({"role": "user", "content": user_input, "timestamp": datetime.now()})
+    add_message({"role": "user", "content": user_input, "timestamp": datetime.now()})
+    memory = st.session_state.memory
+    history = memory.get_context()
     
     # Retrieve relevant documents
     with st.spinner("🔍 Searching knowledge base..."):
-        retrieved_docs = st.session_state.retriever.retrieve(user_input, top_k=3)
+        retrieved_docs = get_retriever().retrieve(user_input, top_k=3)
     
     # Generate response
     with st.spinner("🤖 Generating response..."):
-        response = st.session_state.agent.generate_response(user_input, retrieved_docs)
+        response = st.session_state.agent.generate_response(user_input, retrieved_docs, history)
         # Remove question repetition from response
         response = format_response(response)
         # Clean up response to remove question repetition
@@ -191,17 +313,28 @@ def process_user_input(user_input: str):
             if response.endswith("'"):
                 response = response[:-1]
     
-    # Add assistant message to chat
-    st.session_state.messages.append({
+    # Keep failed turns out of the memory so error text is never fed back to the LLM
+    if not response.startswith(ERROR_RESPONSE_PREFIX):
+        memory.add_turn("user", user_input)
+        memory.add_turn("assistant", response)
+    
+    # Add assistant message to chat, keeping chunk references rather than chunk text
+    add_message({
         "role": "assistant", 
         "content": response, 
-        "sources": retrieved_docs,
+        "sources": [
+            {"filename": filename, "chunk_id": metadata['chunk_id'],
+             "checksum": chunk_checksum(text), "score": metadata['score']}
+            for filename, text, metadata in retrieved_docs
+        ],
+        "collection": st.session_state.collection,
         "timestamp": datetime.now()
     })
 
 def main():
     """Main application function."""
     initialize_session_state()
+    get_stats_server()
     
     # Auto-load components on startup
     if not st.session_state.documents_loaded:
@@ -223,13 +356,19 @@ def main():
     # Chat interface
     st.markdown("### 💬 Chat")
     
-    # Display chat history
-    for i, message in enumerate(st.session_state.messages):
+    # Display the most recent page(s) of chat history
+    messages = st.session_state.messages
+    window = st.session_state.history_window
+    if len(messages) > window:
+        if st.button(f"⬆️ Show older messages ({len(messages) - window} hidden)"):
+            st.session_state.history_window += HISTORY_PAGE_SIZE
+            st.rerun()
+    for message in messages[-window:]:
         if message["role"] == "user":
             display_chat_message("user", message["content"])
         else:
             sources = message.get("sources", [])
-            display_chat_message("assistant", message["content"], sources)
+            display_chat_message("assistant", message["content"], sources, message.get("collection"))
     
     # User input
     user_input = st.chat_input("Ask a question...")
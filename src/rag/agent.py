@@ -1,23 +1,50 @@
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
 from langchain.chains import LLMChain
 from dotenv import load_dotenv
 
+from helpers import count_tokens
+
 load_dotenv()
 
-class RAGAgent:
-    def __init__(self, model_name: str = "gpt-3.5-turbo"):
-        """Initialize the RAG agent with an LLM."""
-        self.llm = ChatOpenAI(
-            model_name=model_name,
-            temperature=0.7,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
-        
-        self.system_prompt = """You are a friendly and helpful AI assistant that can engage in both casual conversation and provide accurate information based on the knowledge base provided. 
+# Prefix of the message returned in place of an answer when the LLM call fails
+ERROR_RESPONSE_PREFIX = "I encountered an error while generating a response"
+
+# Static instructions are sent first as the system message and never vary
+# between calls; per-request text goes last in the human message.
+KNOWLEDGE_INSTRUCTIONS = """You are a friendly, helpful AI assistant answering questions from a knowledge base.
+
+- Answer from the provided document excerpts; say so when they do not cover the question
+- Use the conversation so far to resolve follow-up questions
+- Start directly with the answer, no greetings
+- Be clear and concise; use bullet points (•) or numbered lists when helpful, one point per line"""
+
+CHAT_INSTRUCTIONS = """You are a friendly, helpful AI assistant. No knowledge base documents matched this message.
+
+- For greetings and small talk, reply warmly and briefly, e.g. "Hello! 👋 How can I help you today?"
+- For other questions, answer from general knowledge, be honest about uncertainty, and mention that the knowledge base did not cover it
+- Use the conversation so far to resolve follow-up questions
+- Keep a conversational tone; use bullet points (•) or numbered lists when helpful"""
+
+KNOWLEDGE_TEMPLATE = """Conversation so far:
+{history}
+
+Document excerpts:
+{context}
+
+Question: {question}"""
+
+CHAT_TEMPLATE = """Conversation so far:
+{history}
+
+Message: {question}"""
+
+# The single combined prompt used before intent-specific templates; kept as
+# the baseline for the prompt token savings report
+LEGACY_PROMPT_TEMPLATE = """You are a friendly and helpful AI assistant that can engage in both casual conversation and provide accurate information based on the knowledge base provided.
 
 Your role is to:
 1. Answer questions based on the retrieved documents when available
@@ -48,6 +75,11 @@ For small talk and greetings, respond naturally:
 - "what's up" → "Not much, just here to help! What's on your mind?"
 - "bye" or "goodbye" → "Goodbye! 👋 Have a great day!"
 
+Use the conversation so far to resolve follow-up questions.
+
+Conversation so far:
+{history}
+
 Context from knowledge base:
 {context}
 
@@ -55,30 +87,122 @@ Question: {question}
 
 Please provide a helpful and engaging response:"""
 
-        self.prompt = ChatPromptTemplate.from_template(self.system_prompt)
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
+LEGACY_NO_CONTEXT = "No relevant documents were found."
+NO_HISTORY = "This is the start of the conversation."
+
+PROMPTS = {
+    "knowledge": (KNOWLEDGE_INSTRUCTIONS, KNOWLEDGE_TEMPLATE),
+    "chat": (CHAT_INSTRUCTIONS, CHAT_TEMPLATE),
+}
+
+# Framing tokens OpenAI adds around every chat message, and once to prime the reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+def _prompt_tokens(*messages: str) -> int:
+    """Tokens of a chat prompt made of ``messages`` with placeholders left empty."""
+    texts = [message.format(history="", context="", question="") for message in messages]
+    return sum(count_tokens(text) for text in texts) + TOKENS_PER_MESSAGE * len(texts) + REPLY_PRIMING_TOKENS
+
+class RAGAgent:
+    def __init__(self, model_name: str = "gpt-3.5-turbo", base_url: Optional[str] = None,
+                 max_retries: int = 2):
+        """Initialize the RAG agent with an LLM.
+
+        ``base_url`` points the agent at any OpenAI-compatible endpoint,
+        falling back to ``OPENAI_BASE_URL`` and then to OpenAI itself.
+        ``max_retries`` is how often a failed LLM call is retried with backoff.
+        """
+        self.llm = ChatOpenAI(
+            model_name=model_name,
+            temperature=0.7,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            openai_api_base=base_url or os.getenv("OPENAI_BASE_URL"),
+            max_retries=max_retries
+        )
+
+        self.chains = {}
+        self.template_tokens = {}
+        for intent, (instructions, template) in PROMPTS.items():
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", instructions),
+                ("human", template)
+            ])
+            self.chains[intent] = LLMChain(llm=self.llm, prompt=prompt)
+            # Fixed token cost of each template, counted once at startup
+            self.template_tokens[intent] = _prompt_tokens(instructions, template)
+        # The legacy template was sent as a single human message
+        self.legacy_template_tokens = _prompt_tokens(LEGACY_PROMPT_TEMPLATE)
+
+        self.last_prompt_report: Dict[str, Any] = {}
+        self.prompt_totals = {"requests": 0, "prompt_tokens": 0, "baseline_tokens": 0, "saved_tokens": 0}
+        self._totals_lock = threading.Lock()
+
+    def generate_response(self, question: str, retrieved_docs: List[Dict[str, Any]], history: str = "",
+                          intent: Optional[str] = None) -> str:
+        """Generate a response based on the question and retrieved documents.
+
+        ``history`` is the rendered conversation memory (see
+        ``ConversationMemory.get_context``) used to answer follow-ups.
+        ``intent`` selects the ``"knowledge"`` or ``"chat"`` template and
+        defaults to knowledge whenever documents were retrieved.
+        """
+        if intent is None:
+            intent = "knowledge" if retrieved_docs else "chat"
 
-    def generate_response(self, question: str, retrieved_docs: List[Dict[str, Any]]) -> str:
-        """Generate a response based on the question and retrieved documents."""
         # Format the context from retrieved documents
-        if retrieved_docs:
-            context_parts = []
-            for doc in retrieved_docs:
-                filename, text, metadata = doc
-                context_parts.append(f"Document: {filename}\nContent: {text}\n")
-            context = "\n".join(context_parts)
-        else:
-            # For small talk or when no documents are retrieved, provide context for casual conversation
-            context = "This appears to be a casual conversation or small talk query. No specific documents were retrieved as this is not a knowledge-based question."
-        
+        context_parts = []
+        for doc in retrieved_docs:
+            filename, text, metadata = doc
+            context_parts.append(f"Document: {filename}\nContent: {text}\n")
+        context = "\n".join(context_parts)
+        history = history or NO_HISTORY
+
+        self._record_prompt_tokens(intent, history, context, question)
+
+        inputs = {"history": history, "question": question}
+        if intent == "knowledge":
+            inputs["context"] = context
+
         try:
-            response = self.chain.run({
-                "context": context,
-                "question": question
-            })
+            response = self.chains[intent].run(inputs)
             return response.strip()
         except Exception as e:
-            return f"I encountered an error while generating a response: {str(e)}. Please try again."
+            return f"{ERROR_RESPONSE_PREFIX}: {str(e)}. Please try again."
+
+    def _record_prompt_tokens(self, intent: str, history: str, context: str, question: str):
+        history_tokens = count_tokens(history)
+        question_tokens = count_tokens(question)
+        context_tokens = count_tokens(context) if context else 0
+
+        prompt_tokens = self.template_tokens[intent] + history_tokens + question_tokens
+        if intent == "knowledge":
+            prompt_tokens += context_tokens
+        legacy_context_tokens = context_tokens if context else count_tokens(LEGACY_NO_CONTEXT)
+        baseline_tokens = self.legacy_template_tokens + history_tokens + question_tokens + legacy_context_tokens
+
+        self.last_prompt_report = {
+            "intent": intent,
+            "static_tokens": self.template_tokens[intent],
+            "prompt_tokens": prompt_tokens,
+            "baseline_tokens": baseline_tokens,
+            "saved_tokens": baseline_tokens - prompt_tokens
+        }
+        with self._totals_lock:
+            self.prompt_totals["requests"] += 1
+            self.prompt_totals["prompt_tokens"] += prompt_tokens
+            self.prompt_totals["baseline_tokens"] += baseline_tokens
+            self.prompt_totals["saved_tokens"] += baseline_tokens - prompt_tokens
+
+    def get_prompt_report(self) -> Dict[str, Any]:
+        """Prompt token savings against the legacy single template."""
+        with self._totals_lock:
+            totals = dict(self.prompt_totals)
+        return {
+            "template_tokens": dict(self.template_tokens, legacy=self.legacy_template_tokens),
+            "last_request": dict(self.last_prompt_report),
+            "totals": totals
+        }
 
     def get_agent_info(self) -> Dict[str, str]:
         """Get information about the agent."""
@@ -86,4 +210,4 @@ Please provide a helpful and engaging response:"""
             "model": self.llm.model_name,
             "temperature": str(self.llm.temperature),
             "description": "RAG Agent that provides responses based on knowledge base documents"
-        } 
\ No newline at end of file
+        }
@@ -0,0 +1,157 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Any
+from sentence_transformers import SentenceTransformer
+
+from retriever import DocumentRetriever, EMBEDDING_MODEL
+from embedding_server import load_embedding_model
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS_PATH = os.path.join(os.path.dirname(__file__), '../../knowledge_bases')
+# Total bytes of resident indexes before least recently used collections are evicted
+MEMORY_BUDGET_BYTES = 512 * 1024 * 1024
+
+class CollectionManager:
+    """Load named knowledge bases on demand and keep their indexes under a memory budget.
+
+    Each collection is a directory under ``root`` with a ``documents/`` folder
+    of ``.txt`` files and an optional ``off_topic_queries.txt`` for threshold
+    calibration; its index is persisted next to it in ``index/``.
+    Resident retrievers share one embedding model and are evicted in least
+    recently used order once their combined footprint exceeds the budget.
+    """
+
+    def __init__(self, root: str = COLLECTIONS_PATH, memory_budget: int = MEMORY_BUDGET_BYTES,
+                 model: Optional[SentenceTransformer] = None,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.model = model
+        self.on_event = on_event
+        self._resident: "OrderedDict[str, DocumentRetriever]" = OrderedDict()
+        self._footprints: Dict[str, int] = {}
+        # Loads in progress; callers for the same collection wait on its future
+        self._loading: Dict[str, Future] = {}
+        # Guards residency bookkeeping only, never held while loading
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'loads': 0,
+            'evictions': 0,
+            'load_seconds': 0.0
+        }
+
+    def list_collections(self) -> List[str]:
+        """List the collections available on disk."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name, 'documents'))
+        )
+
+    def get(self, name: str) -> DocumentRetriever:
+        """Return the retriever for a collection, loading it if it is not resident."""
+        if not re.fullmatch(r'[\w.-]+', name) or name.startswith('.'):
+            raise ValueError(f"Invalid collection name: {name!r}")
+
+        with self._lock:
+            retriever = self._resident.get(name)
+            if retriever is not None:
+                self._resident.move_to_end(name)
+                self.stats['hits'] += 1
+                return retriever
+
+            future = self._loading.get(name)
+            loading_here = future is None
+            if loading_here:
+                documents_path = os.path.join(self.root, name, 'documents')
+                if not os.path.isdir(documents_path):
+                    raise KeyError(f"Unknown collection: {name}")
+                future = Future()
+                self._loading[name] = future
+
+        if not loading_here:
+            return future.result()
+
+        try:
+            start = time.perf_counter()
+            retriever = DocumentRetriever(
+                documents_path=documents_path,
+                index_path=os.path.join(self.root, name, 'index'),
+                model=self._get_model(),
+                off_topic_path=os.path.join(self.root, name, 'off_topic_queries.txt')
+            )
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[name]
+            self._resident[name] = retriever
+            self._footprints[name] = retriever.memory_footprint()
+            self.stats['loads'] += 1
+            self.stats['load_seconds'] += elapsed
+            self._emit('load', name=name, seconds=elapsed, bytes=self._footprints[name])
+            self._evict_over_budget(keep=name)
+        future.set_result(retriever)
+        return retriever
+
+    def _get_model(self):
+        with self._model_lock:
+            if self.model is None:
+                self.model = load_embedding_model(EMBEDDING_MODEL)
+            return self.model
+
+    def evict(self, name: str) -> bool:
+        """Drop a collection from memory; its persisted index stays on disk."""
+        with self._lock:
+            return self._evict(name, reason='manual')
+
+    def resident_bytes(self) -> int:
+        """Total estimated footprint of resident collections."""
+        return sum(self._footprints.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return load and eviction counters, current residency and per-collection corpus statistics."""
+        with self._lock:
+            return dict(
+                self.stats,
+                resident=list(self._resident),
+                resident_bytes=self.resident_bytes(),
+                memory_budget=self.memory_budget,
+                collections={name: retriever.stats.snapshot() for name, retriever in self._resident.items()}
+            )
+
+    def _evict_over_budget(self, keep: str):
+        # The most recently requested collection is never evicted, even if it
+        # alone exceeds the budget
+        while self.resident_bytes() > self.memory_budget:
+            oldest = next(iter(self._resident))
+            if oldest == keep:
+                break
+            self._evict(oldest, reason='budget')
+
+    def _evict(self, name: str, reason: str) -> bool:
+        if name not in self._resident:
+            return False
+        del self._resident[name]
+        freed = self._footprints.pop(name)
+        self.stats['evictions'] += 1
+        self._emit('evict', name=name, reason=reason, bytes=freed)
+        return True
+
+    def _emit(self, event: str, **details):
+        logger.info("collection %s: %s", event, details)
+        if self.on_event:
+            self.on_event(event, details)
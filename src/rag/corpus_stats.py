@@ -0,0 +1,115 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+from helpers import count_tokens
+
+class CorpusStats:
+    """Corpus and index statistics maintained as documents are ingested.
+
+    Every counter is updated when a file is added, replaced or removed and
+    when the index is built or updated, so reading them never walks the
+    corpus. Full builds and incremental updates are timed separately.
+    """
+
+    def __init__(self):
+        self.chunks_per_file: Dict[str, int] = {}
+        self.chars_per_file: Dict[str, int] = {}
+        self.tokens_per_file: Dict[str, int] = {}
+        self.chunk_chars_per_file: Dict[str, int] = {}
+        self.total_chunks = 0
+        self.total_chars = 0
+        self.total_tokens = 0
+        self.total_chunk_chars = 0
+        self.index_type: Optional[str] = None
+        self.index_bytes = 0
+        self.embedding_dim = 0
+        self.last_build_seconds = 0.0
+        self.built_at: Optional[float] = None
+        self.updates = 0
+        self.last_update_seconds = 0.0
+        self.updated_at: Optional[float] = None
+
+    def add_file(self, filename: str, text: str, chunk_chars: int, n_chunks: int):
+        """Count a newly ingested file and its chunks."""
+        if filename in self.chunks_per_file:
+            self.remove_file(filename)
+        tokens = count_tokens(text)
+        self.chunks_per_file[filename] = n_chunks
+        self.chars_per_file[filename] = len(text)
+        self.tokens_per_file[filename] = tokens
+        self.chunk_chars_per_file[filename] = chunk_chars
+        self.total_chunks += n_chunks
+        self.total_chars += len(text)
+        self.total_tokens += tokens
+        self.total_chunk_chars += chunk_chars
+
+    def remove_file(self, filename: str):
+        """Stop counting a file."""
+        self.total_chunks -= self.chunks_per_file.pop(filename, 0)
+        self.total_chars -= self.chars_per_file.pop(filename, 0)
+        self.total_tokens -= self.tokens_per_file.pop(filename, 0)
+        self.total_chunk_chars -= self.chunk_chars_per_file.pop(filename, 0)
+
+    def record_index(self, index, build_seconds: float):
+        """Record the shape and cost of a freshly built index."""
+        self.last_build_seconds = build_seconds
+        self.built_at = time.time()
+        self._record_shape(index)
+
+    def record_update(self, index, update_seconds: float):
+        """Record the shape and cost of an index after an incremental update."""
+        self.updates += 1
+        self.last_update_seconds = update_seconds
+        self.updated_at = time.time()
+        self._record_shape(index)
+
+    def _record_shape(self, index):
+        if index is None:
+            self.index_type = None
+            self.index_bytes = 0
+            self.embedding_dim = 0
+            return
+        self.index_type = type(index).__name__
+        self.embedding_dim = index.d
+        # Flat indexes store one code of ``code_size`` bytes per vector
+        self.index_bytes = getattr(index, 'code_size', index.d * 4) * index.ntotal
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current statistics, including how long ago the index was built and last updated.
+
+        Reads only running totals, so the cost does not grow with the corpus;
+        per-file chunk counts are in ``chunks_per_file``.
+        """
+        return {
+            'documents': len(self.chunks_per_file),
+            'total_chunks': self.total_chunks,
+            'total_chars': self.total_chars,
+            'total_tokens': self.total_tokens,
+            'index_type': self.index_type,
+            'index_bytes': self.index_bytes,
+            'chunk_text_chars': self.total_chunk_chars,
+            'embedding_dim': self.embedding_dim,
+            'last_build_seconds': self.last_build_seconds,
+            'snapshot_age_seconds': time.time() - self.built_at if self.built_at else None,
+            'updates_since_build': self.updates,
+            'last_update_seconds': self.last_update_seconds,
+            'update_age_seconds': time.time() - self.updated_at if self.updated_at else None
+        }
+
+    def to_json(self) -> str:
+        """Export the current snapshot as JSON."""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable state for persisting alongside the index."""
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CorpusStats":
+        """Restore statistics saved with ``to_dict``."""
+        stats = cls()
+        for key, value in data.items():
+            if hasattr(stats, key):
+                setattr(stats, key, value)
+        return stats
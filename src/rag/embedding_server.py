@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Shared embedding service for the RAG AI Agent.
+One process holds the SentenceTransformer weights and serves ``encode``
+requests over a Unix socket, merging small requests that arrive within a
+short window into a single forward pass. Bulk requests such as index builds
+are encoded separately so they never hold up query encodes.
+``EmbeddingClient`` is a drop-in replacement for the model that falls back
+to an in-process copy whenever the service is unavailable.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+from typing import List, Optional, Union
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+# Set to a socket path to make retrievers use the shared service
+SOCKET_ENV_VAR = "EMBEDDING_SOCKET"
+DEFAULT_SOCKET_PATH = "/tmp/rag_embeddings.sock"
+# How long the batcher waits for more requests after the first one arrives
+MAX_BATCH_WAIT = 0.005
+# Upper bound on texts in one forward pass; larger requests take the bulk path
+MAX_BATCH_TEXTS = 256
+# Seconds before a client retries the service after failing to reach it
+RETRY_INTERVAL = 30.0
+# Extra seconds a client waits per text of a bulk request before giving up
+BULK_SECONDS_PER_TEXT = 0.05
+
+_HEADER = struct.Struct("!I")
+
+def _send(sock: socket.socket, header: dict, payload: bytes = b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data + payload)
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _recv_header(sock: socket.socket) -> dict:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length))
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+class EmbeddingServiceError(RuntimeError):
+    """The embedding service was reached but could not answer the request."""
+
+class MicroBatcher:
+    """Combine concurrent encode requests into batched forward passes.
+
+    The first queued request opens a window of ``max_wait`` seconds; every
+    request that arrives before it closes is encoded in the same
+    ``model.encode`` call, as long as the batch stays within ``max_texts``.
+    Larger requests belong on ``BulkEncoder``.
+    """
+
+    def __init__(self, model: SentenceTransformer, max_wait: float = MAX_BATCH_WAIT,
+                 max_texts: int = MAX_BATCH_TEXTS):
+        self.model = model
+        self.max_wait = max_wait
+        self.max_texts = max_texts
+        self.requests = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        if len(texts) > self.max_texts:
+            raise ValueError(f"{len(texts)} texts exceed the batch limit of {self.max_texts}")
+        future = Future()
+        self.requests.put((texts, future))
+        return future
+
+    def _run(self):
+        while True:
+            if self._carry is not None:
+                batch, self._carry = [self._carry], None
+            else:
+                batch = [self.requests.get()]
+            count = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_texts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if count + len(item[0]) > self.max_texts:
+                    # Starts the next batch instead of overflowing this one
+                    self._carry = item
+                    break
+                batch.append(item)
+                count += len(item[0])
+            self._encode(batch)
+
+    def _encode(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = np.asarray(
+                self.model.encode(texts, batch_size=min(len(texts), self.max_texts)),
+                dtype=np.float32
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(texts)
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(embeddings[start:start + len(request_texts)])
+            start += len(request_texts)
+
+class BulkEncoder:
+    """Encode large requests one at a time, in slices of ``slice_size`` texts.
+
+    Runs on its own thread so index builds do not delay the latency-sensitive
+    requests handled by ``MicroBatcher``.
+    """
+
+    def __init__(self, model: SentenceTransformer, slice_size: int = MAX_BATCH_TEXTS):
+        self.model = model
+        self.slice_size = slice_size
+        self.requests = queue.Queue()
+        self.stats = {"requests": 0, "texts": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self.requests.put((texts, future))
+        return future
+
+    def _run(self):
+        while True:
+            texts, future = self.requests.get()
+            try:
+                parts = [
+                    np.asarray(self.model.encode(texts[start:start + self.slice_size],
+                                                 batch_size=self.slice_size), dtype=np.float32)
+                    for start in range(0, len(texts), self.slice_size)
+                ]
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+            future.set_result(np.concatenate(parts))
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server routing small requests to a ``MicroBatcher`` and bulk ones to a ``BulkEncoder``.
+
+    Requests name the model they expect and are refused if it is not
+    ``model_name``, since another model's vectors would not match the index.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, model_name: str, batcher: MicroBatcher, bulk: BulkEncoder):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.model_name = model_name
+        self.batcher = batcher
+        self.bulk = bulk
+        super().__init__(socket_path, _EncodeHandler)
+
+class _EncodeHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv_header(self.request)
+            except ConnectionError:
+                return
+            try:
+                if request.get("model") != self.server.model_name:
+                    raise ValueError(f"service runs {self.server.model_name}, not {request.get('model')}")
+                texts = request["texts"]
+                if request.get("bulk") or len(texts) > self.server.batcher.max_texts:
+                    embeddings = self.server.bulk.submit(texts).result()
+                else:
+                    embeddings = self.server.batcher.submit(texts).result()
+                if request.get("normalize"):
+                    embeddings = _normalize(embeddings)
+                _send(self.request, {"shape": list(embeddings.shape)}, embeddings.tobytes())
+            except Exception as e:
+                _send(self.request, {"error": str(e)})
+
+class EmbeddingClient:
+    """Encode texts through the shared service, falling back to a local model.
+
+    Supports the subset of ``SentenceTransformer.encode`` the retriever uses.
+    Requests of more than ``MAX_BATCH_TEXTS`` texts are flagged as bulk and
+    get ``BULK_SECONDS_PER_TEXT`` extra seconds per text, since an index
+    build can take minutes. Only connection failures and timeouts count as
+    an outage: the local model is then loaded and the service retried every
+    ``retry_interval`` seconds. Errors reported by the service, such as a
+    model mismatch, raise ``EmbeddingServiceError``.
+    """
+
+    def __init__(self, socket_path: str, model_name: str, timeout: float = 30.0,
+                 retry_interval: float = RETRY_INTERVAL):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local_model: Optional[SentenceTransformer] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def encode(self, sentences: Union[str, List[str]], normalize_embeddings: bool = False,
+               **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        embeddings = None
+        if time.monotonic() >= self._retry_at:
+            try:
+                embeddings = self._remote_encode(texts, normalize_embeddings)
+            except OSError as e:
+                logger.warning("Embedding service at %s unavailable (%s); encoding in-process",
+                               self.socket_path, e)
+                self._retry_at = time.monotonic() + self.retry_interval
+        if embeddings is None:
+            embeddings = self._get_local_model().encode(
+                texts, normalize_embeddings=normalize_embeddings, **kwargs
+            )
+
+        return embeddings[0] if single else embeddings
+
+    def _remote_encode(self, texts: List[str], normalize: bool) -> np.ndarray:
+        bulk = len(texts) > MAX_BATCH_TEXTS
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            if bulk:
+                sock.settimeout(self.timeout + len(texts) * BULK_SECONDS_PER_TEXT)
+            _send(sock, {"model": self.model_name, "texts": texts, "normalize": normalize, "bulk": bulk})
+            header = _recv_header(sock)
+            if "error" in header:
+                raise EmbeddingServiceError(f"Embedding service at {self.socket_path}: {header['error']}")
+            rows, dim = header["shape"]
+            data = _recv_exact(sock, rows * dim * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(rows, dim)
+
+    def _get_local_model(self) -> SentenceTransformer:
+        with self._lock:
+            if self._local_model is None:
+                self._local_model = SentenceTransformer(self.model_name)
+            return self._local_model
+
+def load_embedding_model(model_name: str):
+    """Return a client for the shared service when configured, else a local model."""
+    socket_path = os.getenv(SOCKET_ENV_VAR)
+    if socket_path:
+        return EmbeddingClient(socket_path, model_name)
+    return SentenceTransformer(model_name)
+
+def main(argv=None):
+    """Run the embedding service until interrupted."""
+    sys.path.append(os.path.dirname(__file__))
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../utils'))
+    from retriever import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Serve sentence embeddings over a Unix socket.")
+    parser.add_argument("--socket", default=os.getenv(SOCKET_ENV_VAR, DEFAULT_SOCKET_PATH),
+                        help="Socket path (default: $EMBEDDING_SOCKET or /tmp/rag_embeddings.sock)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="SentenceTransformer model name")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_BATCH_WAIT * 1000,
+                        help="Batching window in milliseconds")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_TEXTS, help="Maximum texts per forward pass")
+    args = parser.parse_args(argv)
+
+    print(f"🔄 Loading embedding model {args.model}...")
+    model = SentenceTransformer(args.model)
+    batcher = MicroBatcher(model, args.max_wait_ms / 1000, args.max_batch)
+    server = EmbeddingServer(args.socket, args.model, batcher, BulkEncoder(model, args.max_batch))
+    print(f"✅ Embedding service listening on {args.socket}")
+    print(f"   Set {SOCKET_ENV_VAR}={args.socket} for the app and batch jobs to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        stats = batcher.stats
+        print(f"\n👋 Stopped after {stats['requests']} requests in {stats['batches']} batches")
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import re
+from typing import Callable, List, Optional, Tuple
+
+from helpers import count_tokens, get_token_encoding
+
+# Token budget for verbatim recent turns
+MAX_RECENT_TOKENS = 800
+# Token budget for the rolling summary of older turns
+MAX_SUMMARY_TOKENS = 200
+# Characters of each folded turn kept by the default summarizer
+SUMMARY_SNIPPET_CHARS = 160
+
+def extractive_summary(summary: str, role: str, content: str) -> str:
+    """Fold a turn into the summary by keeping its first sentence."""
+    first_sentence = re.split(r'(?<=[.!?])\s+', content.strip(), maxsplit=1)[0]
+    snippet = first_sentence[:SUMMARY_SNIPPET_CHARS]
+    if len(first_sentence) > SUMMARY_SNIPPET_CHARS:
+        snippet += "..."
+    line = f"{role}: {snippet}"
+    return f"{summary}\n{line}" if summary else line
+
+class ConversationMemory:
+    """Token-bounded conversation memory for follow-up questions.
+
+    Recent turns are kept verbatim up to ``max_recent_tokens``; older turns
+    are folded into a rolling summary capped at ``max_summary_tokens``, so
+    memory per session stays bounded however long the conversation runs.
+    ``summarizer(summary, role, content)`` returns the updated summary and
+    can be swapped for an LLM-backed one.
+    """
+
+    def __init__(self, max_recent_tokens: int = MAX_RECENT_TOKENS,
+                 max_summary_tokens: int = MAX_SUMMARY_TOKENS,
+                 summarizer: Optional[Callable[[str, str, str], str]] = None):
+        self.max_recent_tokens = max_recent_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.summarizer = summarizer or extractive_summary
+        self.summary = ""
+        self.turns: List[Tuple[str, str, int]] = []
+        self.recent_tokens = 0
+
+    def add_turn(self, role: str, content: str):
+        """Record a turn, folding the oldest turns into the summary when over budget."""
+        tokens = count_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.recent_tokens += tokens
+
+        # Always keep the latest turn verbatim, even if it alone is over budget
+        while self.recent_tokens > self.max_recent_tokens and len(self.turns) > 1:
+            old_role, old_content, old_tokens = self.turns.pop(0)
+            self.recent_tokens -= old_tokens
+            self.summary = self.summarizer(self.summary, old_role, old_content)
+        self._trim_summary()
+
+    def get_context(self) -> str:
+        """Render the summary and recent turns for the prompt."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}")
+        if self.turns:
+            parts.append("\n".join(f"{role}: {content}" for role, content, _ in self.turns))
+        return "\n\n".join(parts)
+
+    def clear(self):
+        """Forget the whole conversation."""
+        self.summary = ""
+        self.turns = []
+        self.recent_tokens = 0
+
+    def _trim_summary(self):
+        # Drop the oldest summary lines first; the newest context matters most
+        while self.summary and count_tokens(self.summary) > self.max_summary_tokens:
+            _, _, rest = self.summary.partition("\n")
+            if not rest:
+                encoding = get_token_encoding()
+                tokens = encoding.encode(self.summary)
+                self.summary = encoding.decode(tokens[-self.max_summary_tokens:])
+                break
+            self.summary = rest
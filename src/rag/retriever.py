@@ -1,27 +1,120 @@
 import os
 import re
-from typing import List, Tuple, Dict
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import List, Tuple, Dict, Optional
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import faiss
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import tiktoken
 
+from embedding_server import load_embedding_model
+from corpus_stats import CorpusStats
+
 DOCUMENTS_PATH = os.path.join(os.path.dirname(__file__), '../../documents')
+# Questions the knowledge base cannot answer, one per line, used to calibrate RELEVANCE_THRESHOLD
+OFF_TOPIC_QUERIES_PATH = os.path.join(os.path.dirname(__file__), '../../off_topic_queries.txt')
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+# Cosine similarity below which a chunk is treated as irrelevant to the query
+RELEVANCE_THRESHOLD = 0.3
+# Drop in similarity between consecutive results that ends adaptive retrieval
+MAX_SCORE_GAP = 0.1
+# Percentile of off-topic best-match scores the calibrated threshold must clear, plus a margin
+CALIBRATION_PERCENTILE = 90
+CALIBRATION_MARGIN = 0.05
+# Weight of novelty versus relevance when re-selecting results with MMR (0 disables MMR)
+MMR_DIVERSITY = 0.3
+# Candidates fetched from the index per requested result for MMR to choose from
+MMR_POOL_FACTOR = 4
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.faiss"
+CHUNKS_FILENAME = "chunks.json"
+
+def chunk_checksum(text: str) -> str:
+    """Short content fingerprint identifying a chunk's text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def mmr_select(query_vec: np.ndarray, candidate_vecs: np.ndarray, k: int,
+               diversity: float = MMR_DIVERSITY) -> List[int]:
+    """Pick ``k`` candidates by maximal marginal relevance.
+
+    Vectors must be normalized. Candidate similarities are computed once as a
+    single matrix product; each of the ``k`` greedy steps is then one
+    vectorized update of every candidate's similarity to the chosen set.
+    Returns candidate positions in selection order.
+    """
+    k = min(k, len(candidate_vecs))
+    if k <= 0:
+        return []
+    relevance = candidate_vecs @ query_vec
+    similarity = candidate_vecs @ candidate_vecs.T
+    
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(len(candidate_vecs), dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
 
 class DocumentRetriever:
-    def __init__(self):
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
+    def __init__(self, documents_path: str = DOCUMENTS_PATH, index_path: Optional[str] = None,
+                 model: Optional[SentenceTransformer] = None,
+                 off_topic_path: Optional[str] = OFF_TOPIC_QUERIES_PATH):
+        """Load documents from ``documents_path`` and build their search index.
+
+        When ``index_path`` is given the index is persisted there and reused
+        on later runs until a document in ``documents_path`` changes. If the
+        ``off_topic_path`` file exists, the relevance threshold is calibrated
+        from its queries and saved with the index. Pass a
+        shared ``model`` to avoid loading one embedding model per retriever;
+        otherwise the shared embedding service is used when ``EMBEDDING_SOCKET``
+        is set.
+        """
+        self.documents_path = documents_path
+        self.index_path = index_path
+        self.off_topic_path = off_topic_path
+        self.model = model or load_embedding_model(EMBEDDING_MODEL)
+        self.relevance_threshold = RELEVANCE_THRESHOLD
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
+        self.stats = CorpusStats()
+        self.mmr_timings = {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        # The retriever is shared across sessions and load test threads
+        self._timings_lock = threading.Lock()
+        # (filename, chunk_id) -> row, built on first lookup
+        self._chunk_rows: Optional[Dict[Tuple[str, int], int]] = None
+        if not (index_path and self.load_index()):
+            self.build_index()
+
+    def build_index(self):
+        """Ingest every document and build the index from scratch."""
+        start = time.perf_counter()
+        self.stats = CorpusStats()
         self.documents, self.chunks, self.chunk_texts = self.load_and_process_documents()
+        self._chunk_rows = None
         self.index = self.create_index(self.chunk_texts)
+        self.stats.record_index(self.index, time.perf_counter() - start)
+        self.relevance_threshold = self.threshold_from_file()
+        if self.index_path:
+            self.save_index()
 
     def load_and_process_documents(self) -> Tuple[List[str], List[Dict], List[str]]:
         """Load documents and split them into chunks."""
@@ -29,37 +122,195 @@ class DocumentRetriever:
         chunks = []
         chunk_texts = []
         
-        for fname in os.listdir(DOCUMENTS_PATH):
-            fpath = os.path.join(DOCUMENTS_PATH, fname)
+        for fname in sorted(os.listdir(self.documents_path)):
+            fpath = os.path.join(self.documents_path, fname)
             if fname.endswith('.txt'):
                 with open(fpath, 'r', encoding='utf-8') as f:
                     text = f.read()
-                    
-                # Split text into chunks
-                text_chunks = self.text_splitter.split_text(text)
                 
-                for i, chunk in enumerate(text_chunks):
-                    documents.append(fname)
-                    chunks.append({
-                        'filename': fname,
-                        'chunk_id': i,
-                        'start_char': text.find(chunk),
-                        'end_char': text.find(chunk) + len(chunk)
-                    })
-                    chunk_texts.append(chunk)
+                file_chunks, text_chunks = self.split_document(fname, text)
+                self.stats.add_file(fname, text, sum(len(chunk) for chunk in text_chunks), len(text_chunks))
+                documents.extend([fname] * len(text_chunks))
+                chunks.extend(file_chunks)
+                chunk_texts.extend(text_chunks)
         
         return documents, chunks, chunk_texts
 
+    def split_document(self, fname: str, text: str) -> Tuple[List[Dict], List[str]]:
+        """Split one document into chunks with their position metadata."""
+        text_chunks = self.text_splitter.split_text(text)
+        chunks = []
+        for i, chunk in enumerate(text_chunks):
+            chunks.append({
+                'filename': fname,
+                'chunk_id': i,
+                'start_char': text.find(chunk),
+                'end_char': text.find(chunk) + len(chunk)
+            })
+        return chunks, text_chunks
+
+    def add_document(self, fname: str, text: str):
+        """Save a document to ``documents_path`` and index it without a full rebuild.
+
+        A document that is already indexed under ``fname`` is replaced. The
+        chunks are embedded before anything is changed, so a failed encode
+        leaves the file, index and statistics as they were. The file is saved
+        so later rebuilds keep the document and the manifest matches disk.
+
+        This mutates the index in place and must not run while other threads
+        search this retriever; it is meant for offline updates.
+        """
+        if os.path.basename(fname) != fname or not fname.endswith('.txt'):
+            raise ValueError(f"Invalid document name: {fname!r}")
+        
+        start = time.perf_counter()
+        chunks, text_chunks = self.split_document(fname, text)
+        embeddings = self.model.encode(text_chunks, normalize_embeddings=True) if text_chunks else None
+        
+        fpath = os.path.join(self.documents_path, fname)
+        tmp_path = f"{fpath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, fpath)
+        
+        if fname in self.stats.chunks_per_file:
+            self.remove_document_chunks(fname)
+        if embeddings is not None:
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(embeddings.shape[1])
+            self.index.add(embeddings)
+        self.documents.extend([fname] * len(text_chunks))
+        self.chunks.extend(chunks)
+        self.chunk_texts.extend(text_chunks)
+        self._chunk_rows = None
+        self.stats.add_file(fname, text, sum(len(chunk) for chunk in text_chunks), len(text_chunks))
+        self.stats.record_update(self.index, time.perf_counter() - start)
+        if self.index_path:
+            self.save_index()
+
+    def remove_document_chunks(self, fname: str):
+        """Drop a document's chunks from the index and chunk lists."""
+        rows = [row for row, doc in enumerate(self.documents) if doc == fname]
+        if rows and self.index is not None:
+            # Flat indexes renumber the remaining vectors in order, keeping
+            # rows aligned with the chunk lists
+            self.index.remove_ids(np.array(rows, dtype=np.int64))
+            if self.index.ntotal == 0:
+                self.index = None
+        keep = [row for row, doc in enumerate(self.documents) if doc != fname]
+        self.documents = [self.documents[row] for row in keep]
+        self.chunks = [self.chunks[row] for row in keep]
+        self.chunk_texts = [self.chunk_texts[row] for row in keep]
+        self._chunk_rows = None
+        self.stats.remove_file(fname)
+
     def create_index(self, texts: List[str]):
         """Create FAISS index from text embeddings."""
         if not texts:
             return None
         
-        embeddings = self.model.encode(texts)
-        index = faiss.IndexFlatL2(embeddings.shape[1])
+        # Normalized embeddings make inner product equal to cosine similarity,
+        # so search scores are comparable across queries
+        embeddings = self.model.encode(texts, normalize_embeddings=True)
+        index = faiss.IndexFlatIP(embeddings.shape[1])
         index.add(embeddings)
         return index
 
+    def document_manifest(self) -> Dict[str, List[int]]:
+        """Size and modification time of every document, keyed by filename."""
+        manifest = {}
+        for fname in os.listdir(self.documents_path):
+            if fname.endswith('.txt'):
+                stat = os.stat(os.path.join(self.documents_path, fname))
+                manifest[fname] = [stat.st_size, stat.st_mtime_ns]
+        return manifest
+
+    def off_topic_manifest(self) -> Optional[List[int]]:
+        """Size and modification time of the off-topic queries file, if any."""
+        if not self.off_topic_path or not os.path.exists(self.off_topic_path):
+            return None
+        stat = os.stat(self.off_topic_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def threshold_from_file(self) -> float:
+        """Calibrate from the off-topic queries file, or fall back to the default threshold."""
+        if self.off_topic_manifest() is None:
+            return RELEVANCE_THRESHOLD
+        with open(self.off_topic_path, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        return self.compute_threshold(queries)
+
+    def save_index(self):
+        """Persist the index and chunk data to ``index_path``.
+
+        Each file is written to a temporary name and moved into place, and
+        the chunk file is replaced last, so concurrent readers never see a
+        partially written file.
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        index_file = os.path.join(self.index_path, INDEX_FILENAME)
+        if self.index is not None:
+            tmp_path = f"{index_file}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, index_file)
+        elif os.path.exists(index_file):
+            os.remove(index_file)
+        
+        chunks_file = os.path.join(self.index_path, CHUNKS_FILENAME)
+        tmp_path = f"{chunks_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'manifest': self.document_manifest(),
+                'off_topic_manifest': self.off_topic_manifest(),
+                'relevance_threshold': self.relevance_threshold,
+                'documents': self.documents,
+                'chunks': self.chunks,
+                'chunk_texts': self.chunk_texts,
+                'stats': self.stats.to_dict()
+            }, f)
+        os.replace(tmp_path, chunks_file)
+
+    def load_index(self) -> bool:
+        """Load a previously persisted index and its chunk data.
+
+        Returns False when there is nothing usable to load: no saved index,
+        documents added, removed or changed since it was saved, or files
+        that cannot be read or do not match each other.
+        """
+        try:
+            with open(os.path.join(self.index_path, CHUNKS_FILENAME), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('manifest') != self.document_manifest() or 'stats' not in data:
+                return False
+            
+            index = None
+            if data['chunk_texts']:
+                index = faiss.read_index(os.path.join(self.index_path, INDEX_FILENAME))
+                if index.ntotal != len(data['chunk_texts']):
+                    return False
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning("Could not load index from %s (%s); rebuilding", self.index_path, e)
+            return False
+        
+        self.stats = CorpusStats.from_dict(data['stats'])
+        self.documents = data['documents']
+        self.chunks = data['chunks']
+        self.chunk_texts = data['chunk_texts']
+        self._chunk_rows = None
+        self.index = index
+        self.relevance_threshold = data.get('relevance_threshold', RELEVANCE_THRESHOLD)
+        if data.get('off_topic_manifest') != self.off_topic_manifest():
+            # Only the calibration queries changed; the index itself is still valid
+            self.relevance_threshold = self.threshold_from_file()
+            self.save_index()
+        return True
+
+    def memory_footprint(self) -> int:
+        """Estimate the bytes held by the index and chunk texts."""
+        return self.stats.index_bytes + self.stats.total_chunk_chars
+
     def is_small_talk(self, query: str) -> bool:
         """Detect if the query is small talk or casual conversation."""
         small_talk_patterns = [
@@ -89,32 +340,137 @@ class DocumentRetriever:
                 return True
         return False
 
-    def retrieve(self, query: str, top_k: int = 3) -> List[Tuple[str, str, Dict]]:
-        """Retrieve relevant document chunks for a query."""
+    def retrieve(self, query: str, top_k: int = 3,
+                 min_score: Optional[float] = None,
+                 max_gap: float = MAX_SCORE_GAP,
+                 diversity: float = MMR_DIVERSITY) -> List[Tuple[str, str, Dict]]:
+        """Retrieve relevant document chunks for a query.
+
+        Returns at most ``top_k`` chunks, each with its cosine similarity
+        stored under ``metadata['score']``. Chunks scoring below ``min_score``
+        (default: the calibrated ``relevance_threshold``) are dropped, and
+        retrieval stops early once the score falls by more than ``max_gap``
+        from the previous result.
+
+        With ``diversity`` above zero, ``top_k * MMR_POOL_FACTOR`` candidates
+        are fetched and the final chunks are chosen among the relevant ones by
+        maximal marginal relevance, so near-duplicate overlapping chunks do
+        not crowd out other information.
+        """
+        return self.retrieve_batch([query], top_k, min_score, max_gap, diversity)[0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 3,
+                       min_score: Optional[float] = None,
+                       max_gap: float = MAX_SCORE_GAP,
+                       diversity: float = MMR_DIVERSITY) -> List[List[Tuple[str, str, Dict]]]:
+        """Retrieve chunks for many queries with one encode and one index search.
+
+        Results follow the same rules as ``retrieve``, one list per query.
+        """
+        results = [[] for _ in queries]
         if not self.index or not self.chunk_texts:
-            return []
+            return results
         
         # For small talk, return empty results to let the agent handle it conversationally
-        if self.is_small_talk(query):
-            return []
+        positions = [i for i, query in enumerate(queries) if not self.is_small_talk(query)]
+        if not positions:
+            return results
+        
+        if min_score is None:
+            min_score = self.relevance_threshold
         
-        query_emb = self.model.encode([query])
-        D, I = self.index.search(query_emb, top_k)
+        pool_size = top_k * MMR_POOL_FACTOR if diversity > 0 else top_k
+        query_embs = np.asarray(
+            self.model.encode([queries[i] for i in positions], normalize_embeddings=True),
+            dtype=np.float32
+        )
+        D, I = self.index.search(query_embs, pool_size)
         
-        results = []
-        for i, (distance, idx) in enumerate(zip(D[0], I[0])):
-            if idx < len(self.chunk_texts):
-                results.append((
+        for position, query_emb, scores, ids in zip(positions, query_embs, D, I):
+            candidates = []
+            previous_score = None
+            for score, idx in zip(scores, ids):
+                if idx < 0 or idx >= len(self.chunk_texts):
+                    continue
+                score = float(score)
+                if score < min_score:
+                    break
+                if previous_score is not None and previous_score - score > max_gap:
+                    break
+                previous_score = score
+                candidates.append((int(idx), score))
+            
+            if len(candidates) > top_k:
+                candidates = self._rerank_mmr(query_emb, candidates, top_k, diversity)
+            
+            for idx, score in candidates:
+                results[position].append((
                     self.documents[idx],
                     self.chunk_texts[idx],
-                    self.chunks[idx]
+                    dict(self.chunks[idx], score=score)
                 ))
         
         return results
 
+    def _rerank_mmr(self, query_emb: np.ndarray, candidates: List[Tuple[int, float]], top_k: int,
+                    diversity: float) -> List[Tuple[int, float]]:
+        start = time.perf_counter()
+        ids = np.array([idx for idx, _ in candidates], dtype=np.int64)
+        chosen = mmr_select(query_emb, self.index.reconstruct_batch(ids), top_k, diversity)
+        elapsed = time.perf_counter() - start
+        
+        with self._timings_lock:
+            self.mmr_timings['calls'] += 1
+            self.mmr_timings['total_seconds'] += elapsed
+            self.mmr_timings['max_seconds'] = max(self.mmr_timings['max_seconds'], elapsed)
+        return [candidates[i] for i in chosen]
+
+    def find_chunk(self, filename: str, chunk_id: int,
+                   checksum: Optional[str] = None) -> Optional[Tuple[str, str, Dict]]:
+        """Look up a chunk by filename and chunk id.
+
+        Returns None when the chunk is no longer in the index, e.g. after the
+        document was removed or shortened and the index rebuilt. Pass the
+        ``chunk_checksum`` of the text that was shown to also get None when
+        the document was edited and that position now holds different text.
+        """
+        if self._chunk_rows is None:
+            self._chunk_rows = {
+                (chunk['filename'], chunk['chunk_id']): row for row, chunk in enumerate(self.chunks)
+            }
+        row = self._chunk_rows.get((filename, chunk_id))
+        if row is None:
+            return None
+        if checksum is not None and chunk_checksum(self.chunk_texts[row]) != checksum:
+            return None
+        return self.documents[row], self.chunk_texts[row], self.chunks[row]
+
+    def compute_threshold(self, off_topic_queries: List[str],
+                          percentile: float = CALIBRATION_PERCENTILE,
+                          margin: float = CALIBRATION_MARGIN) -> float:
+        """Threshold that the best matches of most off-topic queries fall below.
+
+        ``off_topic_queries`` should be questions the knowledge base cannot
+        answer; any chunk they match is noise. The threshold is placed
+        ``margin`` above the ``percentile`` of their best-match scores, so a
+        single outlier query cannot push it above genuine matches.
+        """
+        if not self.index or not off_topic_queries:
+            return RELEVANCE_THRESHOLD
+        
+        query_embs = self.model.encode(off_topic_queries, normalize_embeddings=True)
+        D, _ = self.index.search(query_embs, 1)
+        return float(np.percentile(D[:, 0], percentile)) + margin
+
+    def calibrate_threshold(self, off_topic_queries: List[str],
+                            percentile: float = CALIBRATION_PERCENTILE,
+                            margin: float = CALIBRATION_MARGIN) -> float:
+        """Set and persist the relevance threshold from off-topic queries (see ``compute_threshold``)."""
+        self.relevance_threshold = self.compute_threshold(off_topic_queries, percentile, margin)
+        if self.index_path:
+            self.save_index()
+        return self.relevance_threshold
+
     def get_document_summary(self) -> Dict[str, int]:
         """Get summary of loaded documents."""
-        doc_counts = {}
-        for doc in self.documents:
-            doc_counts[doc] = doc_counts.get(doc, 0) + 1
-        return doc_counts 
\ No newline at end of file
+        return dict(self.stats.chunks_per_file) 
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Statistics endpoint for the RAG AI Agent.
+Serves the registered statistics as JSON over HTTP so monitoring can poll
+them, e.g. ``curl http://127.0.0.1:8502/stats``.
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Set to a port number to serve statistics from the Streamlit app
+STATS_PORT_ENV_VAR = "RAG_STATS_PORT"
+
+class StatsServer:
+    """Serve ``GET /stats`` with the current value of every registered source.
+
+    A source is a callable returning a JSON-serializable dict, such as
+    ``CorpusStats.snapshot``; it is called on every request, so sources
+    should be cheap to read.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/stats"
+
+    def register(self, name: str, source: Callable[[], Dict[str, Any]]):
+        """Publish ``source()`` under ``name``, replacing any earlier source."""
+        with self._lock:
+            self.sources[name] = source
+
+    def collect(self) -> Dict[str, Any]:
+        """Current value of every source; a failing source reports its error."""
+        with self._lock:
+            sources = dict(self.sources)
+        result = {}
+        for name, source in sources.items():
+            try:
+                result[name] = source()
+            except Exception as e:
+                result[name] = {"error": f"{type(e).__name__}: {e}"}
+        return result
+
+    def start(self) -> "StatsServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info("Serving statistics at %s", self.url)
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        stats_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/stats":
+                    self._reply(404, {"error": f"Unknown path {self.path}"})
+                    return
+                self._reply(200, stats_server.collect())
+
+            def _reply(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload, indent=2).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,6 +1,17 @@
 import re
+from functools import lru_cache
 from typing import List, Dict, Any
 import os
+import tiktoken
+
+@lru_cache(maxsize=1)
+def get_token_encoding():
+    """Tokenizer used by OpenAI chat models, loaded on first use."""
+    return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str) -> int:
+    """Count tokens the way OpenAI chat models do."""
+    return len(get_token_encoding().encode(text))
 
 def clean_text(text: str) -> str:
     """Basic text cleaning utility."""
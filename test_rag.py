@@ -6,15 +6,54 @@ This script tests the core functionality without the Streamlit UI.
 
 import os
 import sys
+import json
 from dotenv import load_dotenv
 
 # Add src directories to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src/rag'))
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src/utils'))
 
-from retriever import DocumentRetriever
+import time
+import tempfile
+import threading
+import numpy as np
+from retriever import DocumentRetriever, mmr_select, chunk_checksum
+from corpus_stats import CorpusStats
+from collection_manager import CollectionManager
+from embedding_server import (MicroBatcher, BulkEncoder, EmbeddingServer, EmbeddingClient,
+                              EmbeddingServiceError)
+from memory import ConversationMemory
 from agent import RAGAgent
-from helpers import validate_question, format_response
+from helpers import validate_question, format_response, count_tokens
+from batch_qa import load_completed, read_questions
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for the sentence embedding model.
+
+    Records the size of every ``encode`` call in ``batch_sizes``.
+    """
+
+    def __init__(self, dim: int = 16, delay: float = 0.0):
+        self.dim = dim
+        self.delay = delay
+        self.batch_sizes = []
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.batch_sizes.append(len(texts))
+        time.sleep(self.delay)
+        vectors = np.array([
+            np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(self.dim) for text in texts
+        ], dtype=np.float32).reshape(len(texts), self.dim)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+def check(condition: bool, message: str) -> bool:
+    """Print a pass or fail line for one check."""
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
 
 def test_document_loading():
     """Test document loading and processing."""
@@ -50,10 +89,194 @@ def test_retrieval(retriever):
             results = retriever.retrieve(query, top_k=2)
             print(f"Found {len(results)} relevant chunks:")
             for i, (filename, text, metadata) in enumerate(results):
-                print(f"   {i+1}. {filename} (chunk {metadata['chunk_id']})")
+                print(f"   {i+1}. {filename} (chunk {metadata['chunk_id']}, score {metadata['score']:.3f})")
                 print(f"      Preview: {text[:100]}...")
         except Exception as e:
             print(f"❌ Error retrieving documents: {e}")
+    
+    timings = retriever.mmr_timings
+    if timings['calls']:
+        print(f"\n⏱️  MMR re-selection: {timings['total_seconds'] / timings['calls'] * 1000:.3f} ms average, "
+              f"{timings['max_seconds'] * 1000:.3f} ms max over {timings['calls']} queries")
+
+def test_mmr_latency():
+    """Benchmark MMR re-selection for typical candidate pool sizes."""
+    print("\n⏱️  Testing MMR latency...")
+    
+    rng = np.random.default_rng(0)
+    for pool_size in (12, 40, 100):
+        vectors = rng.standard_normal((pool_size + 1, 384)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            mmr_select(vectors[0], vectors[1:], 3)
+        per_call_ms = (time.perf_counter() - start) / runs * 1000
+        status = "✅" if per_call_ms < 1 else "⚠️ "
+        print(f"{status} pool of {pool_size}: {per_call_ms:.3f} ms per selection")
+
+def test_collection_manager():
+    """Test shared concurrent loads and least recently used eviction."""
+    print("\n📂 Testing collection manager...")
+    
+    with tempfile.TemporaryDirectory() as root:
+        for name in ("alpha", "beta", "gamma"):
+            os.makedirs(os.path.join(root, name, "documents"))
+            with open(os.path.join(root, name, "documents", "notes.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Notes about {name}. " * 200)
+        
+        # A slow model keeps the first load running while the other callers arrive
+        manager = CollectionManager(root, memory_budget=10**9, model=FakeEmbeddingModel(delay=0.2))
+        loaded = []
+        threads = [threading.Thread(target=lambda: loaded.append(manager.get("alpha"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        check(len({id(retriever) for retriever in loaded}) == 1 and manager.stats['loads'] == 1,
+              f"4 concurrent gets shared {manager.stats['loads']} load")
+        
+        # Room for two collections but not three
+        manager.memory_budget = manager.resident_bytes() * 5 // 2
+        manager.get("beta")
+        manager.get("alpha")
+        manager.get("gamma")
+        stats = manager.get_stats()
+        check(stats['resident'] == ["alpha", "gamma"] and stats['evictions'] == 1,
+              f"least recently used collection evicted (resident: {stats['resident']})")
+        check(stats['resident_bytes'] <= manager.memory_budget, "resident indexes stay within the budget")
+
+def test_conversation_memory():
+    """Test that conversation memory stays within its token budgets."""
+    print("\n🧠 Testing conversation memory...")
+    
+    memory = ConversationMemory(max_recent_tokens=60, max_summary_tokens=30)
+    for i in range(20):
+        memory.add_turn("user", f"Question {i}: what do the documents say about topic {i}?")
+        memory.add_turn("assistant", f"Answer {i}. The documents cover topic {i} in some detail.")
+    check(memory.recent_tokens <= 60, f"recent turns within budget ({memory.recent_tokens}/60 tokens)")
+    summary_tokens = count_tokens(memory.summary)
+    check(0 < summary_tokens <= 30, f"summary within budget ({summary_tokens}/30 tokens)")
+    check(memory.turns[-1][1].startswith("Answer 19"), "latest turn kept verbatim")
+    
+    long_turn = ConversationMemory(max_recent_tokens=5)
+    long_turn.add_turn("user", "word " * 50)
+    check(len(long_turn.turns) == 1, "a single turn over budget is still kept")
+
+def test_batch_resume():
+    """Test batch checkpoint recovery and question ids."""
+    print("\n📦 Testing batch resume...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "answers.jsonl")
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "1", "answer": "ok"}) + "\n")
+            f.write(json.dumps({"id": "2", "error": "failed"}) + "\n")
+            f.write(json.dumps({"id": "3", "answer": "ok"}) + "\n")
+            # Partial last line left by a crash
+            f.write('{"id": "4", "ans')
+        completed = load_completed(output)
+        check(completed == {"1", "3"}, f"answered ids recovered: {sorted(completed)}")
+        with open(output, "r", encoding="utf-8") as f:
+            kept = [json.loads(line)["id"] for line in f]
+        check(kept == ["1", "3"], "failed and truncated lines dropped from the checkpoint")
+        
+        questions = os.path.join(tmp, "questions.jsonl")
+        with open(questions, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"question": "First question?"}) + "\n")
+            f.write(json.dumps({"id": "1", "question": "Second question?"}) + "\n")
+        ids = [item["id"] for item in read_questions(questions)]
+        check(ids == ["row-1", "1"], f"positional ids do not collide with explicit ones: {ids}")
+        
+        with open(questions, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "1", "question": "Third question?"}) + "\n")
+        try:
+            list(read_questions(questions))
+            check(False, "duplicate ids rejected")
+        except ValueError:
+            check(True, "duplicate ids rejected")
+
+def test_embedding_service():
+    """Test micro-batching limits, the bulk path and client fallback."""
+    print("\n🔌 Testing embedding service...")
+    
+    model = FakeEmbeddingModel()
+    batcher = MicroBatcher(model, max_wait=0.05, max_texts=8)
+    futures = [batcher.submit([f"text {i}-{j}" for j in range(3)]) for i in range(10)]
+    results = [future.result(timeout=5) for future in futures]
+    check(all(result.shape == (3, model.dim) for result in results), "every request gets its own rows back")
+    check(max(model.batch_sizes) <= 8, f"batches stay within 8 texts (largest {max(model.batch_sizes)})")
+    check(len(model.batch_sizes) < len(futures), f"10 requests encoded in {len(model.batch_sizes)} batches")
+    try:
+        batcher.submit(["text"] * 9)
+        check(False, "oversized requests rejected by the batcher")
+    except ValueError:
+        check(True, "oversized requests rejected by the batcher")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        offline = EmbeddingClient(os.path.join(tmp, "missing.sock"), "fake-model")
+        offline._local_model = model
+        vectors = offline.encode(["a", "b"])
+        check(vectors.shape == (2, model.dim) and offline._retry_at > time.monotonic(),
+              "client falls back to the local model when the service is down")
+        
+        socket_path = os.path.join(tmp, "embeddings.sock")
+        server = EmbeddingServer(socket_path, "fake-model", batcher, BulkEncoder(model, 8))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = EmbeddingClient(socket_path, "fake-model")
+            check(np.allclose(client.encode("hello"), model.encode("hello")), "service answers a query")
+            bulk = client.encode([f"chunk {i}" for i in range(20)])
+            check(bulk.shape == (20, model.dim), "requests over the batch limit go through the bulk path")
+            
+            mismatched = EmbeddingClient(socket_path, "other-model")
+            try:
+                mismatched.encode("hello")
+                check(False, "model mismatch raised")
+            except EmbeddingServiceError:
+                check(mismatched._local_model is None and mismatched._retry_at == 0.0,
+                      "service errors are raised, not treated as an outage")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+def test_corpus_stats():
+    """Test incremental corpus statistics and in-place document updates."""
+    print("\n📊 Testing corpus statistics...")
+    
+    stats = CorpusStats()
+    stats.add_file("a.txt", "alpha text", 10, 2)
+    stats.add_file("b.txt", "beta", 4, 1)
+    stats.add_file("a.txt", "alpha", 5, 1)
+    check(stats.total_chunks == 2 and stats.total_chars == 9 and stats.total_chunk_chars == 9,
+          "re-adding a file replaces its counts")
+    stats.remove_file("b.txt")
+    check(stats.total_chunks == 1 and stats.total_tokens == count_tokens("alpha")
+          and stats.snapshot()['documents'] == 1, "removing a file subtracts its counts")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        documents_path = os.path.join(tmp, "documents")
+        index_path = os.path.join(tmp, "index")
+        os.makedirs(documents_path)
+        with open(os.path.join(documents_path, "f1.txt"), "w", encoding="utf-8") as f:
+            f.write("The original text of the first document. " * 60)
+        
+        model = FakeEmbeddingModel()
+        retriever = DocumentRetriever(documents_path, index_path=index_path, model=model, off_topic_path=None)
+        _, old_text, _ = retriever.find_chunk("f1.txt", 0)
+        built_at = retriever.stats.built_at
+        
+        retriever.add_document("f1.txt", "short replacement text")
+        snapshot = retriever.stats.snapshot()
+        check(snapshot['total_chunks'] == 1 and retriever.index.ntotal == 1 and snapshot['updates_since_build'] == 1,
+              "replacing a document swaps its chunks in the index and totals")
+        check(retriever.stats.built_at == built_at, "updates leave the build time alone")
+        check(retriever.find_chunk("f1.txt", 0, chunk_checksum(old_text)) is None,
+              "sources pointing at the old text no longer resolve")
+        
+        reloaded = DocumentRetriever(documents_path, index_path=index_path, model=model, off_topic_path=None)
+        check(reloaded.chunk_texts == ["short replacement text"] and reloaded.stats.built_at == built_at,
+              "the update is persisted and reloaded without a rebuild")
 
 def test_agent_response(retriever):
     """Test AI agent response generation."""
@@ -124,6 +347,12 @@ def main():
     
     # Test retrieval
     test_retrieval(retriever)
+    test_mmr_latency()
+    test_collection_manager()
+    test_conversation_memory()
+    test_batch_resume()
+    test_embedding_service()
+    test_corpus_stats()
     
     # Test agent
     agent = test_agent_response(retriever)